@@ -1,13 +1,71 @@
 # api/app.py
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import boto3
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from multipart.multipart import MultipartParser, parse_options_header
+from multipart.exceptions import MultipartParseError
+from contextlib import AsyncExitStack, asynccontextmanager
+from collections import deque
+import aioboto3
+from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
+import asyncio
 import os
+import time
 import uuid
-import json
-from typing import Optional
+import orjson
+from typing import List, Optional
 
-app = FastAPI(title="Audio Transcription API")
+# Shared session; clients are opened once per process in the app lifespan
+session = aioboto3.Session()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open the AWS clients on startup and close them on shutdown.
+    """
+    async with AsyncExitStack() as stack:
+        # Initialize AWS clients with optional local endpoints
+        # The S3 connection pool must be larger than the number of parts in
+        # flight so that concurrent uploads don't wait on each other for connections
+        app.state.s3_client = await stack.enter_async_context(session.client(
+            's3',
+            endpoint_url=S3_ENDPOINT,
+            config=AioConfig(max_pool_connections=50)
+        ))
+        # Pre-signed URLs are handed to clients, so they must be signed for the
+        # endpoint clients can reach, which may differ from the internal one
+        if S3_PUBLIC_ENDPOINT:
+            app.state.presign_client = await stack.enter_async_context(
+                session.client('s3', endpoint_url=S3_PUBLIC_ENDPOINT)
+            )
+        else:
+            app.state.presign_client = app.state.s3_client
+        app.state.sqs_client = await stack.enter_async_context(
+            session.client('sqs', endpoint_url=SQS_ENDPOINT)
+        )
+        app.state.dynamodb = await stack.enter_async_context(
+            session.resource('dynamodb', endpoint_url=DYNAMODB_ENDPOINT)
+        )
+
+        # Low-level client for the hot /status path, which skips the resource
+        # layer's (de)serialization of attributes it doesn't need
+        app.state.dynamodb_client = await stack.enter_async_context(
+            session.client('dynamodb', endpoint_url=DYNAMODB_ENDPOINT)
+        )
+
+        # DynamoDB tables
+        app.state.transcription_table = await app.state.dynamodb.Table(TRANSCRIPTION_TABLE)
+        app.state.notes_table = await app.state.dynamodb.Table(NOTES_TABLE)
+
+        yield
+
+app = FastAPI(
+    title="Audio Transcription API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # Enable CORS
 app.add_middleware(
@@ -22,50 +80,264 @@ app.add_middleware(
 AUDIO_BUCKET_NAME = os.environ.get("AUDIO_BUCKET_NAME", "audio-files")
 PROCESSING_QUEUE_URL = os.environ.get("PROCESSING_QUEUE_URL")
 S3_ENDPOINT = os.environ.get("S3_ENDPOINT")
+S3_PUBLIC_ENDPOINT = os.environ.get("S3_PUBLIC_ENDPOINT")
 SQS_ENDPOINT = os.environ.get("SQS_ENDPOINT")
 DYNAMODB_ENDPOINT = os.environ.get("DYNAMODB_ENDPOINT")
+TRANSCRIPTION_TABLE = os.environ.get("TRANSCRIPTION_TABLE", "AudioTranscriptions")
+NOTES_TABLE = os.environ.get("NOTES_TABLE", "DiaryNotes")
+
+# Multipart upload settings: the request body is cut into parts of this size and
+# at most MAX_PARTS_IN_FLIGHT of them are buffered/uploading at any time
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MAX_PARTS_IN_FLIGHT = 10
+
+# Lifetime of the pre-signed upload URLs returned by /init-upload/
+PRESIGNED_URL_EXPIRY = 3600
+
+# Responses for completed jobs never change, so they are kept in memory to spare
+# DynamoDB reads from clients polling /status and /result. 'error' is not cached:
+# a redelivered message can still complete a failed job
+RESULT_CACHE_TTL = 300
+RESULT_CACHE_MAX_SIZE = 10000
+_result_cache = {}
+
+# Attempts for reading keys DynamoDB left unprocessed in a batch_get_item
+BATCH_GET_MAX_ATTEMPTS = 5
+
+def get_cached_response(key: tuple) -> Optional[dict]:
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, response = entry
+    if expires_at < time.monotonic():
+        _result_cache.pop(key, None)
+        return None
+    return response
+
+def cache_response(key: tuple, response: dict):
+    if len(_result_cache) >= RESULT_CACHE_MAX_SIZE:
+        # Drop the oldest entry (dicts keep insertion order)
+        _result_cache.pop(next(iter(_result_cache)))
+    _result_cache[key] = (time.monotonic() + RESULT_CACHE_TTL, response)
+
+class InitUploadRequest(BaseModel):
+    filename: str
+
+class MultipartFileStream:
+    """
+    Incrementally parses a multipart/form-data body and yields the bytes of a
+    single file field as they arrive, without spooling the body to disk.
+    """
+
+    def __init__(self, content_type_header: str, field_name: str = "file"):
+        content_type, params = parse_options_header(content_type_header)
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Expected a multipart/form-data request")
+
+        self.filename: Optional[str] = None
+        self._field_name = field_name.encode()
+        self._in_file = False
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._data: List[bytes] = []
+        self._parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        Feed a chunk of the request body and return the file data it contained.
+        """
+        self._parser.write(chunk)
+        data, self._data = self._data, []
+        return data
+
+    def finish(self):
+        self._parser.finalize()
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # Only the first file sent under the expected field name is kept
+        if (self.filename is None and options.get(b"name") == self._field_name
+                and b"filename" in options):
+            self.filename = options[b"filename"].decode("utf-8")
+            self._in_file = True
 
-# Initialize AWS clients with optional local endpoints
-s3_client = boto3.client('s3', endpoint_url=S3_ENDPOINT)
-sqs_client = boto3.client('sqs', endpoint_url=SQS_ENDPOINT)
-dynamodb = boto3.resource('dynamodb', endpoint_url=DYNAMODB_ENDPOINT)
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._data.append(data[start:end])
 
-# DynamoDB tables
-try:
-    transcription_table = dynamodb.Table('AudioTranscriptions')
-    notes_table = dynamodb.Table('DiaryNotes')
-except Exception as e:
-    print(f"Warning: DynamoDB tables not available: {e}")
+    def _on_part_end(self):
+        self._in_file = False
+
+
+class S3StreamingUpload:
+    """
+    Uploads a file to S3 part by part as it is received, keeping at most
+    MAX_PARTS_IN_FLIGHT parts in memory. Files smaller than a single part are
+    sent with one put_object call instead of a multipart upload.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self._upload_id = None
+        self._pending = deque()
+        self._parts = []
+
+    async def upload_part(self, data: bytes):
+        """
+        Start uploading a part, waiting while too many parts are in flight.
+        """
+        if self._upload_id is None:
+            response = await self.s3_client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key
+            )
+            self._upload_id = response['UploadId']
+
+        while len(self._pending) >= MAX_PARTS_IN_FLIGHT:
+            self._parts.append(await self._pending.popleft())
+
+        part_number = len(self._parts) + len(self._pending) + 1
+        self._pending.append(asyncio.create_task(self._send_part(part_number, data)))
+
+    async def complete(self, data: bytes):
+        """
+        Upload the remaining data and finish the upload.
+        """
+        if self._upload_id is None:
+            await self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=data)
+            return
+
+        if data:
+            await self.upload_part(data)
+        while self._pending:
+            self._parts.append(await self._pending.popleft())
+
+        await self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={'Parts': self._parts}
+        )
+
+    async def abort(self):
+        for task in self._pending:
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        self._pending.clear()
+
+        if self._upload_id is None:
+            return
+
+        try:
+            await self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id
+            )
+        except Exception as e:
+            print(f"Warning: Could not abort multipart upload: {e}")
+
+    async def _send_part(self, part_number: int, data: bytes) -> dict:
+        response = await self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
 
 @app.get("/")
 async def root():
     return {"message": "Audio Transcription API is running"}
 
 @app.post("/upload-audio/")
-async def upload_audio(file: UploadFile):
+async def upload_audio(request: Request):
     """
     Upload an audio file for transcription and note generation.
+
+    The multipart body is streamed straight to S3 as it is received, so memory
+    use is bounded by the parts in flight rather than by the file size.
     """
+    try:
+        form = MultipartFileStream(request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         # Generate unique ID for this job
         job_id = str(uuid.uuid4())
         
-        # Create S3 file path
-        file_path = f"uploads/{job_id}/{file.filename}"
+        # Stream file to S3
+        upload = None
+        buffer = bytearray()
+        try:
+            async for chunk in request.stream():
+                for data in form.feed(chunk):
+                    if upload is None:
+                        upload = S3StreamingUpload(
+                            app.state.s3_client,
+                            AUDIO_BUCKET_NAME,
+                            f"uploads/{job_id}/{form.filename}"
+                        )
+                    buffer += data
+                    if len(buffer) >= MULTIPART_CHUNKSIZE:
+                        part, buffer = bytes(buffer), bytearray()
+                        await upload.upload_part(part)
+            form.finish()
+
+            if form.filename is None:
+                raise HTTPException(status_code=400, detail="No file provided")
+            if upload is None:
+                # Empty file
+                upload = S3StreamingUpload(
+                    app.state.s3_client,
+                    AUDIO_BUCKET_NAME,
+                    f"uploads/{job_id}/{form.filename}"
+                )
+            await upload.complete(bytes(buffer))
+        except MultipartParseError as e:
+            if upload is not None:
+                await upload.abort()
+            raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+        except Exception:
+            if upload is not None:
+                await upload.abort()
+            raise
         
-        # Upload file to S3
-        s3_client.upload_fileobj(
-            file.file, 
-            AUDIO_BUCKET_NAME, 
-            file_path
-        )
+        file_path = upload.key
         
         # Initialize job status in DynamoDB
         try:
-            transcription_table.put_item(
+            await app.state.transcription_table.put_item(
                 Item={
                     'job_id': job_id,
-                    'file_name': file.filename,
+                    'file_name': form.filename,
                     'file_path': file_path,
                     'job_status': 'queued'
                 }
@@ -74,40 +346,167 @@ async def upload_audio(file: UploadFile):
             print(f"Warning: Could not write to DynamoDB: {e}")
         
         # Send message to SQS for processing
-        sqs_client.send_message(
-            QueueUrl=PROCESSING_QUEUE_URL,
-            MessageBody=json.dumps({
+        await enqueue_job(job_id, file_path, form.filename)
+        
+        return {"job_id": job_id, "status": "queued"}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/init-upload/")
+async def init_upload(upload: InitUploadRequest):
+    """
+    Start a direct upload: returns a pre-signed S3 URL the client PUTs the audio
+    file to, so the file never passes through the API. Call
+    /complete-upload/{job_id} once the PUT has succeeded.
+    """
+    try:
+        # Generate unique ID for this job
+        job_id = str(uuid.uuid4())
+        
+        # Create S3 file path
+        file_path = f"uploads/{job_id}/{upload.filename}"
+        
+        upload_url = await app.state.presign_client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': AUDIO_BUCKET_NAME, 'Key': file_path},
+            ExpiresIn=PRESIGNED_URL_EXPIRY
+        )
+        
+        # The job row is required to complete the upload later
+        await app.state.transcription_table.put_item(
+            Item={
                 'job_id': job_id,
+                'file_name': upload.filename,
                 'file_path': file_path,
-                'file_name': file.filename
-            })
+                'job_status': 'pending_upload'
+            }
         )
         
+        return {
+            "job_id": job_id,
+            "status": "pending_upload",
+            "upload_url": upload_url,
+            "expires_in": PRESIGNED_URL_EXPIRY
+        }
+    
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/complete-upload/{job_id}")
+async def complete_upload(job_id: str):
+    """
+    Queue a job whose file was uploaded through its pre-signed URL.
+    """
+    try:
+        response = await app.state.transcription_table.get_item(
+            Key={'job_id': job_id}
+        )
+        
+        if 'Item' not in response:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        item = response['Item']
+        if item.get('job_status') != 'pending_upload':
+            # Upload was already completed, nothing to do
+            return {"job_id": job_id, "status": item.get('job_status', 'unknown')}
+        
+        # Make sure the file actually landed in S3
+        try:
+            await app.state.s3_client.head_object(
+                Bucket=AUDIO_BUCKET_NAME,
+                Key=item['file_path']
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                raise HTTPException(status_code=409, detail="File has not been uploaded yet")
+            raise
+        
+        # Only one caller may move the job out of pending_upload
+        try:
+            await app.state.transcription_table.update_item(
+                Key={'job_id': job_id},
+                UpdateExpression="set job_status = :s",
+                ConditionExpression="job_status = :p",
+                ExpressionAttributeValues={':s': 'queued', ':p': 'pending_upload'}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return {"job_id": job_id, "status": "queued"}
+            raise
+        
+        # Send message to SQS for processing; if that fails, hand the job back
+        # to pending_upload so a retried call can queue it again
+        try:
+            await enqueue_job(job_id, item['file_path'], item['file_name'])
+        except Exception:
+            try:
+                await app.state.transcription_table.update_item(
+                    Key={'job_id': job_id},
+                    UpdateExpression="set job_status = :p",
+                    ConditionExpression="job_status = :s",
+                    ExpressionAttributeValues={':s': 'queued', ':p': 'pending_upload'}
+                )
+            except Exception as e:
+                print(f"Warning: Could not reset job {job_id} to pending_upload: {e}")
+            raise
+        
         return {"job_id": job_id, "status": "queued"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def enqueue_job(job_id: str, file_path: str, file_name: str):
+    """
+    Send a job to the processing queue.
+    """
+    await app.state.sqs_client.send_message(
+        QueueUrl=PROCESSING_QUEUE_URL,
+        MessageBody=orjson.dumps({
+            'job_id': job_id,
+            'file_path': file_path,
+            'file_name': file_name
+        }).decode()
+    )
+
 @app.get("/status/{job_id}")
 async def check_status(job_id: str):
     """
     Check the status of a transcription job.
     """
+    cached = get_cached_response(('status', job_id))
+    if cached is not None:
+        return cached
+
     try:
-        response = transcription_table.get_item(
-            Key={'job_id': job_id}
+        response = await app.state.dynamodb_client.get_item(
+            TableName=TRANSCRIPTION_TABLE,
+            Key={'job_id': {'S': job_id}},
+            ProjectionExpression='job_status, file_name'
         )
         
         if 'Item' not in response:
             raise HTTPException(status_code=404, detail="Job not found")
         
-        return {
+        item = response['Item']
+        result = {
             "job_id": job_id,
-            "status": response['Item'].get('job_status', 'unknown'),
-            "file_name": response['Item'].get('file_name', '')
+            "status": item.get('job_status', {}).get('S', 'unknown'),
+            "file_name": item.get('file_name', {}).get('S', '')
         }
+        if result["status"] == 'completed':
+            cache_response(('status', job_id), result)
+        return result
     
+    except HTTPException:
+        raise
     except Exception as e:
         if str(e).startswith("An error occurred (ResourceNotFoundException)"):
             raise HTTPException(status_code=404, detail="Job not found")
@@ -118,50 +517,88 @@ async def get_result(job_id: str):
     """
     Get the results of a completed transcription and note generation job.
     """
+    cached = get_cached_response(('result', job_id))
+    if cached is not None:
+        return cached
+
     try:
-        # First check job status
-        status_response = transcription_table.get_item(
-            Key={'job_id': job_id}
-        )
+        # Read the job and its diary note in a single round trip
+        job, note = await get_job_and_note(job_id)
         
-        if 'Item' not in status_response:
+        if job is None:
             raise HTTPException(status_code=404, detail="Job not found")
         
-        if status_response['Item'].get('job_status') != 'completed':
+        if job.get('job_status') != 'completed':
             return {
                 "job_id": job_id,
-                "status": status_response['Item'].get('job_status', 'unknown'),
+                "status": job.get('job_status', 'unknown'),
                 "message": "Processing not yet complete"
             }
         
-        # Get diary note
-        note_response = notes_table.get_item(
-            Key={'job_id': job_id}
-        )
-        
-        if 'Item' not in note_response:
+        if note is None:
             return {
                 "job_id": job_id,
                 "status": "completed",
-                "transcription": status_response['Item'].get('transcription', ''),
+                "transcription": job.get('transcription', ''),
                 "message": "Note generation pending"
             }
         
-        return {
+        result = {
             "job_id": job_id,
             "status": "completed",
-            "transcription": status_response['Item'].get('transcription', ''),
-            "diary_note": note_response['Item'].get('diary_note', '')
+            "transcription": job.get('transcription', ''),
+            "diary_note": note.get('diary_note', '')
         }
+        cache_response(('result', job_id), result)
+        return result
     
+    except HTTPException:
+        raise
     except Exception as e:
         if str(e).startswith("An error occurred (ResourceNotFoundException)"):
             raise HTTPException(status_code=404, detail="Job not found")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def get_job_and_note(job_id: str) -> tuple:
+    """
+    Fetch a job and its diary note with one batch_get_item call.
+    Returns (job, note), either of which is None if it doesn't exist.
+    """
+    request_items = {
+        TRANSCRIPTION_TABLE: {'Keys': [{'job_id': job_id}]},
+        NOTES_TABLE: {'Keys': [{'job_id': job_id}]}
+    }
+    items = {}
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        response = await app.state.dynamodb.meta.client.batch_get_item(
+            RequestItems=request_items
+        )
+        for table, table_items in response.get('Responses', {}).items():
+            if table_items:
+                items[table] = table_items[0]
+        
+        request_items = response.get('UnprocessedKeys')
+        if not request_items:
+            break
+        await asyncio.sleep(0.05 * 2 ** attempt)
+    else:
+        raise RuntimeError(f"Could not read job {job_id}: keys left unprocessed")
+    
+    return items.get(TRANSCRIPTION_TABLE), items.get(NOTES_TABLE)
+
 if __name__ == "__main__":
+    # Standalone launcher; the container runs under gunicorn (see gunicorn_conf.py)
     import uvicorn
-    API_HOST = os.environ.get("API_HOST")
-    API_PORT = os.environ.get("API_PORT")
+    API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+    API_PORT = int(os.environ.get("API_PORT", 8000))
     
-    uvicorn.run("app:app", host=API_HOST, port=API_PORT, reload=True)
\ No newline at end of file
+    uvicorn.run(
+        "app:app",
+        host=API_HOST,
+        port=API_PORT,
+        loop="uvloop",
+        http="httptools",
+        workers=2 * os.cpu_count() + 1,
+        timeout_keep_alive=75,
+        limit_max_requests=10000
+    )
\ No newline at end of file
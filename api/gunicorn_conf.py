@@ -0,0 +1,23 @@
+# api/gunicorn_conf.py
+import multiprocessing
+import os
+
+# Server socket
+bind = f"{os.environ.get('API_HOST', '0.0.0.0')}:{os.environ.get('API_PORT', '8000')}"
+
+# Worker processes: one event loop per worker so TLS, HTTP parsing and JSON
+# encoding spread over all cores. Each worker opens its own AWS clients in the
+# app lifespan, so the app must not be preloaded in the master process.
+workers = int(os.environ.get("API_WORKERS", 2 * multiprocessing.cpu_count() + 1))
+# UvicornWorker picks uvloop and httptools when they are installed
+worker_class = "uvicorn.workers.UvicornWorker"
+worker_connections = 1000
+keepalive = 75
+
+# Recycle workers periodically to bound memory growth from large uploads
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Logging
+accesslog = "-"
+errorlog = "-"
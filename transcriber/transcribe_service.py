@@ -0,0 +1,246 @@
+# transcriber/transcribe_service.py
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import TranscriptionOptions, get_suppressed_tokens
+from faster_whisper.vad import VadOptions, get_speech_timestamps, merge_segments, collect_chunks
+from contextlib import asynccontextmanager
+import numpy as np
+import asyncio
+import io
+import os
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Environment variables
+WHISPER_MODEL = os.environ.get('WHISPER_MODEL', 'base')
+WHISPER_DEVICE = os.environ.get('WHISPER_DEVICE', 'cuda')
+WHISPER_COMPUTE_TYPE = os.environ.get('WHISPER_COMPUTE_TYPE', 'int8_float16')
+WHISPER_BATCH_SIZE = int(os.environ.get('WHISPER_BATCH_SIZE', 8))
+# How long the batcher waits for more chunks before running a partial batch
+BATCH_WAIT_SECONDS = 0.05
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_CHECK_INTERVAL = 1
+
+# Initialize Whisper model once; every worker shares it through this service
+# (CTranslate2 backend, int8 weights with fp16 compute on GPU)
+logger.info("Loading Whisper model...")
+model = WhisperModel(
+    WHISPER_MODEL,
+    device=WHISPER_DEVICE,
+    compute_type=WHISPER_COMPUTE_TYPE,
+    cpu_threads=1
+)
+# Only its batched forward pass is used; chunking and batching happen here so
+# that chunks from concurrent requests share one generate call
+pipeline = BatchedInferencePipeline(model=model)
+logger.info("Whisper model loaded successfully.")
+
+SAMPLING_RATE = model.feature_extractor.sampling_rate
+CHUNK_LENGTH = model.feature_extractor.chunk_length
+VAD_OPTIONS = VadOptions(max_speech_duration_s=CHUNK_LENGTH, min_silence_duration_ms=160)
+
+# A batch mixes chunks from different files, so the language is detected per
+# chunk (multilingual) rather than once per file; "en" is only a placeholder
+# for the language token that gets replaced in each prompt
+tokenizer = Tokenizer(
+    model.hf_tokenizer,
+    model.model.is_multilingual,
+    task="transcribe",
+    language="en",
+)
+options = TranscriptionOptions(
+    beam_size=5,
+    best_of=5,
+    patience=1,
+    length_penalty=1,
+    repetition_penalty=1,
+    no_repeat_ngram_size=0,
+    log_prob_threshold=-1.0,
+    no_speech_threshold=0.6,
+    compression_ratio_threshold=2.4,
+    condition_on_previous_text=False,
+    prompt_reset_on_temperature=0.5,
+    temperatures=[0.0],
+    initial_prompt=None,
+    prefix=None,
+    suppress_blank=True,
+    suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+    without_timestamps=True,
+    max_initial_timestamp=0.0,
+    word_timestamps=False,
+    prepend_punctuations="\"'“¿([{-",
+    append_punctuations="\"'.。,，!！?？:：”)]}、",
+    multilingual=model.model.is_multilingual,
+    max_new_tokens=None,
+    clip_timestamps=None,
+    hallucination_silence_threshold=None,
+    hotwords=None,
+)
+
+# (features, chunk metadata, future) for every chunk waiting to be decoded
+chunk_queue = None
+batcher_task = None
+
+class ClientDisconnected(Exception):
+    """
+    The caller went away (e.g. timed out) before its transcription was done.
+    """
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the batcher on startup and stop it on shutdown.
+    """
+    global chunk_queue, batcher_task
+    chunk_queue = asyncio.Queue()
+    batcher_task = asyncio.create_task(run_batcher())
+    try:
+        yield
+    finally:
+        batcher_task.cancel()
+
+app = FastAPI(title="Transcription Service", lifespan=lifespan)
+
+@app.get("/")
+async def root():
+    return {"message": "Transcription service is running"}
+
+@app.post("/transcribe")
+async def transcribe(request: Request):
+    """
+    Transcribe an audio file sent as the raw request body.
+    """
+    audio_bytes = await request.body()
+    if not audio_bytes:
+        raise HTTPException(status_code=400, detail="No audio provided")
+    
+    # Decoding and inference block, so they run off the event loop
+    try:
+        audio = await run_in_threadpool(decode_audio, io.BytesIO(audio_bytes))
+    except Exception as e:
+        # Undecodable input is a client error; retrying won't help
+        logger.error(f"Error decoding audio: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Could not decode audio: {e}")
+    
+    # Without a running batcher queued chunks would never be decoded
+    if batcher_task is None or batcher_task.done():
+        raise HTTPException(status_code=503, detail="Transcription batcher is not running")
+    
+    try:
+        transcription = await transcribe_audio(request, audio)
+    except ClientDisconnected:
+        logger.info("Client disconnected, dropped its queued chunks")
+        return None
+    except Exception as e:
+        # Inference errors are specific to this input; the worker won't retry them
+        logger.error(f"Error transcribing audio: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return {"transcription": transcription}
+
+async def transcribe_audio(request: Request, audio: np.ndarray) -> str:
+    """
+    Transcribe a 16 kHz mono waveform by queueing its chunks for the batcher.
+    """
+    features, chunks_metadata = await run_in_threadpool(prepare_chunks, audio)
+    loop = asyncio.get_running_loop()
+    futures = []
+    for feature, chunk_metadata in zip(features, chunks_metadata):
+        future = loop.create_future()
+        chunk_queue.put_nowait((feature, chunk_metadata, future))
+        futures.append(future)
+    
+    # Results come back per chunk, in the order the chunks were queued
+    results = asyncio.gather(*futures)
+    try:
+        while not results.done():
+            await asyncio.wait({results}, timeout=DISCONNECT_CHECK_INTERVAL)
+            # uvicorn doesn't cancel handlers of disconnected clients, so stop
+            # here to keep the chunks that are still queued off the GPU
+            if not results.done() and await request.is_disconnected():
+                raise ClientDisconnected()
+        return "".join(results.result())
+    finally:
+        # The batcher skips chunks whose future is already done
+        for future in futures:
+            future.cancel()
+
+def prepare_chunks(audio: np.ndarray):
+    """
+    Split a waveform into speech chunks of at most 30 s and compute their features.
+    """
+    duration = audio.shape[0] / SAMPLING_RATE
+    speech_timestamps = get_speech_timestamps(audio, VAD_OPTIONS)
+    clip_timestamps = merge_segments(speech_timestamps, VAD_OPTIONS)
+    if not clip_timestamps:
+        logger.info(f"No speech found in {duration:.1f}s of audio")
+        return [], []
+    audio_chunks, chunks_metadata = collect_chunks(audio, clip_timestamps)
+    features = [
+        pad_or_trim(model.feature_extractor(chunk)[..., :-1])
+        for chunk in audio_chunks
+    ]
+    return features, chunks_metadata
+
+async def run_batcher():
+    """
+    Collect queued chunks from all requests into batches of up to
+    WHISPER_BATCH_SIZE, waiting at most BATCH_WAIT_SECONDS to fill one.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await chunk_queue.get()]
+        deadline = loop.time() + BATCH_WAIT_SECONDS
+        while len(batch) < WHISPER_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(chunk_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Drop chunks of requests that failed or went away in the meantime
+        batch = [chunk for chunk in batch if not chunk[2].done()]
+        if not batch:
+            continue
+
+        try:
+            results = await decode_batch(batch)
+        except Exception as e:
+            logger.error(f"Error decoding batch of {len(batch)} chunks, retrying them one by one: {str(e)}")
+            # Decode each chunk on its own so one bad chunk can't fail the
+            # chunks of unrelated requests it was batched with
+            results = []
+            for chunk in batch:
+                try:
+                    results.extend(await decode_batch([chunk]))
+                except Exception as chunk_error:
+                    results.append(chunk_error)
+
+        for (_, _, future), result in zip(batch, results):
+            # The request may have gone away while its chunk was decoding
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result("".join(segment["text"] for segment in result))
+
+async def decode_batch(batch: list) -> list:
+    """
+    Run one generate call for a batch of chunks; the GPU runs one batch at a time.
+    """
+    features, chunks_metadata, _ = zip(*batch)
+    return await run_in_threadpool(
+        pipeline.forward, np.stack(features), tokenizer, list(chunks_metadata), options
+    )
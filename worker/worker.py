@@ -1,12 +1,15 @@
 # worker/worker.py
-import boto3
+from aiobotocore.session import get_session
+from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
+from contextlib import AsyncExitStack
+import aiohttp
+import asyncio
 import json
 import os
-import whisper
-import tempfile
 import time
 import logging
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Configure logging
 logging.basicConfig(
@@ -21,164 +24,373 @@ AUDIO_BUCKET_NAME = os.environ.get('AUDIO_BUCKET_NAME')
 TRANSCRIPTION_TABLE = os.environ.get('TRANSCRIPTION_TABLE')
 NOTES_TABLE = os.environ.get('NOTES_TABLE')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+TRANSCRIBE_URL = os.environ.get('TRANSCRIBE_URL')
 
-# Initialize AWS clients with optional local endpoints
-s3_client = boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT'))
-sqs_client = boto3.client('sqs', endpoint_url=os.environ.get('SQS_ENDPOINT'))
-dynamodb = boto3.resource('dynamodb', endpoint_url=os.environ.get('DYNAMODB_ENDPOINT'))
+# Record the intermediate job states (downloading, transcribing, generating_note)
+# in DynamoDB; off by default as each one costs a round trip per job
+DEBUG_STATES = os.environ.get('DEBUG_STATES', '').lower() in ('1', 'true', 'yes')
 
-# Initialize DynamoDB tables
-transcription_table = dynamodb.Table(TRANSCRIPTION_TABLE)
-notes_table = dynamodb.Table(NOTES_TABLE)
+# Number of jobs each worker process works on concurrently
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 10))
 
-# Initialize Whisper model
-logger.info("Loading Whisper model...")
-model = whisper.load_model("base")
-logger.info("Whisper model loaded successfully.")
+# Timeouts for calls to the transcription service
+TRANSCRIBE_TIMEOUT = aiohttp.ClientTimeout(total=600, connect=5)
+
+# Delay before a job is retried when the transcription service is unavailable
+TRANSCRIBE_RETRY_DELAY = 30
+
+# Jobs still failing after this many deliveries are marked failed instead of
+# being retried forever (the queue has no redrive policy)
+MAX_RECEIVE_COUNT = int(os.environ.get('MAX_RECEIVE_COUNT', 5))
+
+# Responses meaning the transcription service (not the audio) is the problem
+UNAVAILABLE_STATUSES = (502, 503, 504)
+
+# SQS returns at most 10 messages per receive_message call
+MAX_MESSAGES_PER_BATCH = 10
+
+# Messages received ahead while the current jobs are processed
+PREFETCH_MESSAGES = 2 * MAX_MESSAGES_PER_BATCH
+
+# Messages held by the worker (prefetched or in progress) are kept invisible by
+# extending their visibility timeout every HEARTBEAT_INTERVAL seconds
+VISIBILITY_TIMEOUT = 300
+HEARTBEAT_INTERVAL = 60
+
+# Ranged GET settings: files are read in DOWNLOAD_CHUNKSIZE byte ranges, and
+# everything after the first range is fetched concurrently
+DOWNLOAD_CHUNKSIZE = 8 * 1024 * 1024
+DOWNLOAD_CONCURRENCY = 8
+
+# AWS clients and the transcription service session, opened in main() and
+# shared by all job coroutines
+s3_client = None
+sqs_client = None
+dynamodb_client = None
+http_session = None
 
 # Initialize OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+# Receipt handles of the messages currently held by this worker
+held_messages = set()
+
+class TranscriptionUnavailable(Exception):
+    """
+    The transcription service could not be reached, timed out or reported being
+    unavailable; the job itself may be fine and is retried later.
+    """
+
+async def receive_messages(messages: asyncio.Queue):
+    """
+    Continuously receive messages from SQS into the queue, so the next jobs are
+    already waiting when a job coroutine becomes free.
+    """
+    while True:
+        try:
+            response = await sqs_client.receive_message(
+                QueueUrl=PROCESSING_QUEUE_URL,
+                MaxNumberOfMessages=MAX_MESSAGES_PER_BATCH,
+                WaitTimeSeconds=20,
+                VisibilityTimeout=VISIBILITY_TIMEOUT,
+                AttributeNames=['ApproximateReceiveCount']
+            )
+            
+            # Check if there are any messages to process
+            if 'Messages' not in response:
+                logger.info("No messages to process")
+                continue
+            
+            held_messages.update(m['ReceiptHandle'] for m in response['Messages'])
+            
+            # Blocks while PREFETCH_MESSAGES messages are already waiting
+            for message in response['Messages']:
+                await messages.put(message)
+        except Exception as e:
+            logger.error(f"Error receiving message: {str(e)}")
+            await asyncio.sleep(5)
+
+async def extend_visibility():
+    """
+    Periodically extend the visibility timeout of the messages held by this
+    worker so they aren't redelivered while waiting or being processed.
+    """
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        
+        receipt_handles = list(held_messages)
+        for start in range(0, len(receipt_handles), MAX_MESSAGES_PER_BATCH):
+            try:
+                await sqs_client.change_message_visibility_batch(
+                    QueueUrl=PROCESSING_QUEUE_URL,
+                    Entries=[
+                        {'Id': str(i), 'ReceiptHandle': receipt_handle, 'VisibilityTimeout': VISIBILITY_TIMEOUT}
+                        for i, receipt_handle in enumerate(receipt_handles[start:start + MAX_MESSAGES_PER_BATCH])
+                    ]
+                )
+            except Exception as e:
+                logger.warning(f"Failed to extend message visibility: {e}")
 
-def process_message():
+async def process_jobs(messages: asyncio.Queue):
+    """
+    Process messages from the queue one after the other. WORKER_CONCURRENCY of
+    these coroutines run side by side, so while one waits on S3, the
+    transcription service or OpenAI the others make progress.
+    """
+    while True:
+        message = await messages.get()
+        try:
+            await process_message(message)
+        except Exception as e:
+            logger.error(f"Error processing message: {str(e)}")
+        finally:
+            # Messages that weren't deleted become visible again for a retry
+            held_messages.discard(message['ReceiptHandle'])
+
+async def process_message(message: dict):
     """
     Process a single message from the SQS queue.
-    Returns True if a message was processed, False otherwise.
     """
     try:
-        # Receive message from SQS
-        response = sqs_client.receive_message(
+        # Parse message body
+        body = json.loads(message['Body'])
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in message body: {e}")
+        # Move message to DLQ by not deleting it and letting visibility timeout expire
+        # In production, you'd use a proper DLQ
+        return
+    
+    job_id = body['job_id']
+    file_path = body['file_path']
+    
+    logger.info(f"Processing job {job_id}, file {file_path}")
+    
+    receive_count = int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1))
+    
+    # A redelivered message for a finished job needs no download, transcription
+    # or note; first deliveries skip the read, store_results guards them anyway
+    if receive_count > 1 and await is_job_completed(job_id):
+        logger.info(f"Job {job_id} was already completed, skipping")
+        await sqs_client.delete_message(
             QueueUrl=PROCESSING_QUEUE_URL,
-            MaxNumberOfMessages=1,
-            WaitTimeSeconds=20
+            ReceiptHandle=message['ReceiptHandle']
         )
+        return
+    
+    try:
+        await set_debug_status(job_id, 'downloading')
+        audio = await download_audio(file_path)
         
-        # Check if there are any messages to process
-        if 'Messages' not in response:
-            logger.info("No messages to process")
-            return False
+        await set_debug_status(job_id, 'transcribing')
+        transcription = await transcribe_audio(job_id, audio)
         
-        message = response['Messages'][0]
-        receipt_handle = message['ReceiptHandle']
+        # Generate diary note
+        await set_debug_status(job_id, 'generating_note')
+        logger.info(f"Generating diary note for job {job_id}")
+        diary_note = await generate_personal_diary(transcription, OPENAI_API_KEY)
         
-        try:
-            # Parse message body
-            body = json.loads(message['Body'])
-            job_id = body['job_id']
-            file_path = body['file_path']
-            
-            logger.info(f"Processing job {job_id}, file {file_path}")
-            
-            # Update job status in DynamoDB
-            try:
-                transcription_table.update_item(
-                    Key={'job_id': job_id},
-                    UpdateExpression="set job_status = :s",
-                    ExpressionAttributeValues={':s': 'downloading'}
-                )
-            except Exception as e:
-                logger.warning(f"Failed to update DynamoDB: {e}")
-            
-            # Download file from S3 to temporary location
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-                try:
-                    logger.info(f"Downloading file from S3: {file_path}")
-                    s3_client.download_file(AUDIO_BUCKET_NAME, file_path, temp_file.name)
-                    
-                    # Update job status in DynamoDB
-                    try:
-                        transcription_table.update_item(
-                            Key={'job_id': job_id},
-                            UpdateExpression="set job_status = :s",
-                            ExpressionAttributeValues={':s': 'transcribing'}
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to update DynamoDB: {e}")
-                    
-                    # Transcribe audio file
-                    logger.info(f"Transcribing file: {temp_file.name}")
-                    result = model.transcribe(temp_file.name, beam_size=5, best_of=5)
-                    transcription = result["text"]
-                    
-                    logger.info(f"Transcription complete for job {job_id}")
-                    
-                    # Store transcription in DynamoDB
-                    try:
-                        transcription_table.update_item(
-                            Key={'job_id': job_id},
-                            UpdateExpression="set transcription = :t, job_status = :s",
-                            ExpressionAttributeValues={
-                                ':t': transcription,
-                                ':s': 'generating_note'
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to update DynamoDB: {e}")
-                    
-                    # Generate diary note
-                    logger.info(f"Generating diary note for job {job_id}")
-                    diary_note = generate_personal_diary(transcription, OPENAI_API_KEY)
-                    
-                    # Store diary note in DynamoDB
-                    try:
-                        notes_table.put_item(
-                            Item={
-                                'job_id': job_id,
-                                'diary_note': diary_note,
-                                'created_at': int(time.time())
-                            }
-                        )
-                        
-                        # Update job status to completed
-                        transcription_table.update_item(
-                            Key={'job_id': job_id},
-                            UpdateExpression="set job_status = :s",
-                            ExpressionAttributeValues={':s': 'completed'}
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to update DynamoDB: {e}")
-                    
-                    logger.info(f"Processing complete for job {job_id}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing file: {str(e)}")
-                    # Update job status to error
-                    try:
-                        transcription_table.update_item(
-                            Key={'job_id': job_id},
-                            UpdateExpression="set job_status = :s, error = :e",
-                            ExpressionAttributeValues={
-                                ':s': 'error',
-                                ':e': str(e)
-                            }
-                        )
-                    except Exception as db_err:
-                        logger.warning(f"Failed to update DynamoDB with error status: {db_err}")
-                finally:
-                    # Delete temporary file
-                    try:
-                        os.unlink(temp_file.name)
-                    except Exception as e:
-                        logger.warning(f"Failed to delete temporary file: {e}")
-            
-            # Delete message from queue
-            sqs_client.delete_message(
+        # Failures other than an already completed job end up in mark_job_failed
+        await store_results(job_id, transcription, diary_note)
+        
+        logger.info(f"Processing complete for job {job_id}")
+    
+    except TranscriptionUnavailable as e:
+        if receive_count >= MAX_RECEIVE_COUNT:
+            logger.error(f"Transcription unavailable for job {job_id} after {receive_count} attempts: {e}")
+            await mark_job_failed(job_id, e)
+        else:
+            logger.warning(f"Transcription service unavailable for job {job_id}, retrying later: {e}")
+            # Keep the message and let it be redelivered shortly
+            await sqs_client.change_message_visibility(
                 QueueUrl=PROCESSING_QUEUE_URL,
-                ReceiptHandle=receipt_handle
+                ReceiptHandle=message['ReceiptHandle'],
+                VisibilityTimeout=TRANSCRIBE_RETRY_DELAY
             )
-            
-            return True
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in message body: {e}")
-            # Move message to DLQ by not deleting it and letting visibility timeout expire
-            # In production, you'd use a proper DLQ
-            return False
-        
+            return
     except Exception as e:
-        logger.error(f"Error receiving message: {str(e)}")
+        logger.error(f"Error processing file: {str(e)}")
+        await mark_job_failed(job_id, e)
+    
+    # Delete message from queue
+    await sqs_client.delete_message(
+        QueueUrl=PROCESSING_QUEUE_URL,
+        ReceiptHandle=message['ReceiptHandle']
+    )
+
+async def download_audio(file_path: str) -> bytes:
+    """
+    Download an audio file from S3 into memory. The first DOWNLOAD_CHUNKSIZE
+    bytes are requested right away; the rest of a larger file is fetched as
+    concurrent ranged GETs.
+    """
+    logger.info(f"Downloading file from S3: {file_path}")
+    
+    async def get_range(start: int, etag: str = None) -> tuple:
+        request = {
+            'Bucket': AUDIO_BUCKET_NAME,
+            'Key': file_path,
+            'Range': f"bytes={start}-{start + DOWNLOAD_CHUNKSIZE - 1}"
+        }
+        if etag:
+            # Fail instead of mixing ranges if the file changes mid-download
+            request['IfMatch'] = etag
+        response = await s3_client.get_object(**request)
+        async with response['Body'] as stream:
+            return response, await stream.read()
+    
+    try:
+        first, data = await get_range(0)
+    except ClientError as e:
+        # S3 rejects any range on an empty object
+        if e.response['Error']['Code'] == 'InvalidRange':
+            return b""
+        raise
+    
+    # ContentRange is "bytes 0-<end>/<size>"; small files fit in this one request
+    size = int(first['ContentRange'].rsplit('/', 1)[1])
+    if size <= DOWNLOAD_CHUNKSIZE:
+        return data
+    
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    
+    async def get_rest(start: int) -> bytes:
+        async with semaphore:
+            _, part = await get_range(start, first['ETag'])
+            return part
+    
+    parts = await asyncio.gather(*(
+        get_rest(start) for start in range(DOWNLOAD_CHUNKSIZE, size, DOWNLOAD_CHUNKSIZE)
+    ))
+    return data + b"".join(parts)
+
+async def transcribe_audio(job_id: str, audio: bytes) -> str:
+    """
+    Transcribe an audio file with the transcription service.
+    Raises TranscriptionUnavailable when the service can't be reached, times out
+    or answers 502/503/504; other errors (e.g. undecodable audio) raise as usual.
+    """
+    logger.info(f"Transcribing job {job_id}")
+    try:
+        async with http_session.post(
+            TRANSCRIBE_URL,
+            data=audio,
+            headers={'Content-Type': 'application/octet-stream'},
+            timeout=TRANSCRIBE_TIMEOUT
+        ) as response:
+            if response.status in UNAVAILABLE_STATUSES:
+                raise TranscriptionUnavailable(f"Transcription service returned {response.status}")
+            response.raise_for_status()
+            transcription = (await response.json())['transcription']
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+        raise TranscriptionUnavailable(str(e) or type(e).__name__) from e
+    
+    logger.info(f"Transcription complete for job {job_id}")
+    return transcription
+
+async def store_results(job_id: str, transcription: str, diary_note: str):
+    """
+    Store the diary note and mark the job completed with its transcription in a
+    single transaction. The completed_at guard makes redelivered messages a no-op.
+    """
+    completed_at = {'N': str(int(time.time()))}
+    try:
+        await dynamodb_client.transact_write_items(
+            TransactItems=[
+                {
+                    'Update': {
+                        'TableName': TRANSCRIPTION_TABLE,
+                        'Key': {'job_id': {'S': job_id}},
+                        'UpdateExpression': "set job_status = :s, transcription = :t, completed_at = :c",
+                        'ConditionExpression': "attribute_not_exists(completed_at)",
+                        'ExpressionAttributeValues': {
+                            ':s': {'S': 'completed'},
+                            ':t': {'S': transcription},
+                            ':c': completed_at
+                        }
+                    }
+                },
+                {
+                    'Put': {
+                        'TableName': NOTES_TABLE,
+                        'Item': {
+                            'job_id': {'S': job_id},
+                            'diary_note': {'S': diary_note},
+                            'created_at': completed_at
+                        }
+                    }
+                }
+            ]
+        )
+    except ClientError as e:
+        reasons = e.response.get('CancellationReasons', [])
+        if reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+            logger.info(f"Job {job_id} was already completed")
+            return
+        raise
+
+async def is_job_completed(job_id: str) -> bool:
+    """
+    Check whether a job already has its results stored.
+    """
+    try:
+        response = await dynamodb_client.get_item(
+            TableName=TRANSCRIPTION_TABLE,
+            Key={'job_id': {'S': job_id}},
+            ProjectionExpression='completed_at',
+            ConsistentRead=True
+        )
+    except Exception as e:
+        # Fall through to processing; store_results still refuses to overwrite
+        logger.warning(f"Failed to read job {job_id} from DynamoDB: {e}")
         return False
+    return 'completed_at' in response.get('Item', {})
 
-def generate_personal_diary(transcription: str, openai_api_key: str, model: str = "gpt-3.5-turbo") -> str:
+async def set_debug_status(job_id: str, status: str):
+    """
+    Record an intermediate job status when DEBUG_STATES is enabled.
+    """
+    if not DEBUG_STATES:
+        return
+    
+    try:
+        await dynamodb_client.update_item(
+            TableName=TRANSCRIPTION_TABLE,
+            Key={'job_id': {'S': job_id}},
+            UpdateExpression="set job_status = :s",
+            ConditionExpression="attribute_not_exists(completed_at)",
+            ExpressionAttributeValues={':s': {'S': status}}
+        )
+    except ClientError as e:
+        # A completed job keeps its final status
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.warning(f"Failed to update DynamoDB: {e}")
+    except Exception as e:
+        logger.warning(f"Failed to update DynamoDB: {e}")
+
+async def mark_job_failed(job_id: str, error: Exception):
+    """
+    Update job status to error.
+    """
+    try:
+        await dynamodb_client.update_item(
+            TableName=TRANSCRIPTION_TABLE,
+            Key={'job_id': {'S': job_id}},
+            UpdateExpression="set job_status = :s, error = :e",
+            ConditionExpression="attribute_not_exists(completed_at)",
+            ExpressionAttributeValues={
+                ':s': {'S': 'error'},
+                ':e': {'S': str(error)}
+            }
+        )
+    except ClientError as db_err:
+        if db_err.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            logger.info(f"Job {job_id} was already completed, not marking it failed")
+        else:
+            logger.warning(f"Failed to update DynamoDB with error status: {db_err}")
+    except Exception as db_err:
+        logger.warning(f"Failed to update DynamoDB with error status: {db_err}")
+
+async def generate_personal_diary(transcription: str, openai_api_key: str, model: str = "gpt-3.5-turbo") -> str:
     """
     Converts a transcription string into a structured personal diary journaling note using OpenAI's LLM.
     """
@@ -192,7 +404,7 @@ def generate_personal_diary(transcription: str, openai_api_key: str, model: str
         )
         
         # Call the OpenAI ChatCompletion endpoint
-        response = openai_client.chat.completions.create(
+        response = await openai_client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": "You are an assistant that helps convert plain text into a structured personal diary entry."},
@@ -209,20 +421,37 @@ def generate_personal_diary(transcription: str, openai_api_key: str, model: str
         logger.error(f"Error generating diary note: {str(e)}")
         return f"Error generating diary note: {str(e)}"
 
-def main():
+async def main():
     """
     Main function to continuously process messages from the queue.
     """
+    global s3_client, sqs_client, dynamodb_client, http_session
+    
     logger.info("Worker service started")
     
-    while True:
-        try:
-            if not process_message():
-                # If no message was processed, sleep briefly to avoid tight polling
-                time.sleep(1)
-        except Exception as e:
-            logger.error(f"Unexpected error in main loop: {str(e)}")
-            time.sleep(5)  # Sleep longer on unexpected errors
+    session = get_session()
+    async with AsyncExitStack() as stack:
+        # Initialize AWS clients with optional local endpoints
+        # The S3 connection pool must cover the ranged GETs of every concurrent job
+        s3_client = await stack.enter_async_context(session.create_client(
+            's3',
+            endpoint_url=os.environ.get('S3_ENDPOINT'),
+            config=AioConfig(max_pool_connections=64)
+        ))
+        sqs_client = await stack.enter_async_context(
+            session.create_client('sqs', endpoint_url=os.environ.get('SQS_ENDPOINT'))
+        )
+        dynamodb_client = await stack.enter_async_context(
+            session.create_client('dynamodb', endpoint_url=os.environ.get('DYNAMODB_ENDPOINT'))
+        )
+        http_session = await stack.enter_async_context(aiohttp.ClientSession())
+        
+        messages = asyncio.Queue(maxsize=PREFETCH_MESSAGES)
+        await asyncio.gather(
+            receive_messages(messages),
+            extend_visibility(),
+            *(process_jobs(messages) for _ in range(WORKER_CONCURRENCY))
+        )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file